@@ -18,6 +18,7 @@ def main(args: argparse.Namespace) -> None:
         population_size=100,
         n_generations=25,
         selection_strategy=modules.scheduler.SelectionStrategy.GREEDY,
+        n_workers=args.n_workers,
     )
     schedule = scheduler.run(groups, rooms, teachers)
     modules.filesystem.utils.export_schedule(schedule, p_schedule_dest)
@@ -29,6 +30,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('--teachers', type=Path, required=True)
     parser.add_argument('--groups', type=Path, required=True)
     parser.add_argument('--rooms', type=Path, required=True)
+    parser.add_argument('--n-workers', type=int, default=None,
+                        help='Score schedules in a pool of this many processes (default: in-process)')
     parser.add_argument('schedule_dest', type=Path)
     return parser.parse_args()
 
@@ -12,6 +12,9 @@ class Group:
         self._size = size
         self._required_subjects: list[tuple[int, Subject]] = subject_requirements
 
+    def __deepcopy__(self, memo: dict) -> 'Group':
+        return self
+
     @property
     def name(self) -> str:
         return self._name
@@ -8,6 +8,9 @@ class Room:
         self._identifier = identifier
         self._capacity = capacity
 
+    def __deepcopy__(self, memo: dict) -> 'Room':
+        return self
+
     @property
     def capacity(self) -> int:
         return self._capacity
@@ -1,13 +1,107 @@
+import numpy as np
+
+from .group import Group
+from .room import Room
 from .session import Session
+from .subject import Subject
+from .teacher import Teacher
+from .time_slot import TimeSlot, TimeSlotDay, TimeSlotTime
+
+# Columns of Schedule.sessions_arr
+GROUP = 0
+ROOM = 1
+TEACHER = 2
+DAY = 3
+TIME = 4
+
+
+class ScheduleRefs:
+    # Lookup tables shared by all schedules of the same groups, rooms and teachers.
+    # Sessions refer to groups, rooms and teachers by their index in these lists.
+    def __init__(
+            self,
+            groups: list[Group],
+            rooms: list[Room],
+            teachers: list[Teacher],
+    ) -> None:
+        self._groups = groups
+        self._rooms = rooms
+        self._teachers = teachers
+
+        # Every schedule holds one session per required lesson, always in the same order,
+        # so the group and the subject of each session row are known in advance.
+        self._session_groups: list[int] = []
+        self._session_subjects: list[Subject] = []
+        for group_ix, group in enumerate(groups):
+            for n_sessions, subject in group.required_subjects:
+                for i in range(n_sessions):
+                    self._session_groups.append(group_ix)
+                    self._session_subjects.append(subject)
+
+        self._group_sizes = np.array([g.size for g in groups], dtype=np.int32)
+        self._room_capacities = np.array([r.capacity for r in rooms], dtype=np.int32)
+
+    def __deepcopy__(self, memo: dict) -> 'ScheduleRefs':
+        # The lookup tables are immutable, deep copies of schedules keep sharing them
+        return self
+
+    @property
+    def groups(self) -> list[Group]:
+        return self._groups
+
+    @property
+    def rooms(self) -> list[Room]:
+        return self._rooms
+
+    @property
+    def teachers(self) -> list[Teacher]:
+        return self._teachers
+
+    @property
+    def session_groups(self) -> list[int]:
+        return self._session_groups
+
+    @property
+    def session_subjects(self) -> list[Subject]:
+        return self._session_subjects
+
+    @property
+    def group_sizes(self) -> np.ndarray:
+        return self._group_sizes
+
+    @property
+    def room_capacities(self) -> np.ndarray:
+        return self._room_capacities
 
 
 class Schedule:
     def __init__(
             self,
-            sessions: list[Session]
+            sessions_arr: np.ndarray,
+            refs: ScheduleRefs,
     ) -> None:
-        self._sessions = sessions
+        # One row per session: [group, room, teacher, day, time]
+        self._sessions_arr = sessions_arr
+        self._refs = refs
+
+    @property
+    def sessions_arr(self) -> np.ndarray:
+        return self._sessions_arr
+
+    @property
+    def refs(self) -> ScheduleRefs:
+        return self._refs
 
     @property
     def sessions(self) -> list[Session]:
-        return self._sessions
+        # Built on every access: modifying the returned sessions does not change the schedule
+        return [
+            Session(
+                room=self._refs.rooms[row[ROOM]],
+                group=self._refs.groups[row[GROUP]],
+                subject=self._refs.session_subjects[i],
+                teacher=self._refs.teachers[row[TEACHER]],
+                time_slot=TimeSlot(day=TimeSlotDay(row[DAY]), time=TimeSlotTime(row[TIME])),
+            )
+            for i, row in enumerate(self._sessions_arr.tolist())
+        ]
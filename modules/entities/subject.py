@@ -7,6 +7,9 @@ class Subject:
     ) -> None:
         self._name = name
 
+    def __deepcopy__(self, memo: dict) -> 'Subject':
+        return self
+
     @property
     def name(self) -> str:
         return self._name
\ No newline at end of file
@@ -11,6 +11,9 @@ class Teacher:
         self._fullname = fullname
         self._teachable_subjects = teachable_subjects
 
+    def __deepcopy__(self, memo: dict) -> 'Teacher':
+        return self
+
     @property
     def fullname(self) -> str:
         return self._fullname
@@ -18,6 +18,10 @@ class TimeSlotTime(enum.Enum):
     SIXTH = 5
 
 
+N_DAYS = len(TimeSlotDay)
+N_TIMES = len(TimeSlotTime)
+
+
 class TimeSlot:
     def __init__(
             self,
@@ -27,6 +31,9 @@ class TimeSlot:
         self._day = day
         self._time = time
 
+    def __deepcopy__(self, memo: dict) -> 'TimeSlot':
+        return self
+
     @property
     def day(self) -> TimeSlotDay:
         return self._day
@@ -16,11 +16,11 @@ def import_groups(p_groups: Path) -> list[Group]:
     #   'math:4, science:2, linguistics:2, pe:1'
     df_groups = pd.read_csv(p_groups)
     groups = []
-    for i, row in df_groups.iterrows():
-        name = row['name']
-        size = int(row['size'])
+    for row in df_groups.itertuples(index=False):
+        name = row.name
+        size = int(row.size)
         subject_requirements = []
-        s_subject_requirements = row['subject_requirements']
+        s_subject_requirements = row.subject_requirements
         for requirement in s_subject_requirements.split(','):
             subject, n_required = requirement.strip().split(':')
             n_required = int(n_required)
@@ -36,7 +36,7 @@ def import_rooms(p_rooms: Path) -> list[Room]:
 
     df_rooms = pd.read_csv(p_rooms)
     rooms = []
-    for i, row in df_rooms.iterrows():
+    for row in df_rooms.itertuples(index=False):
         identifier = int(row.identifier)
         capacity = int(row.capacity)
         rooms.append(Room(identifier=identifier, capacity=capacity))
@@ -50,7 +50,7 @@ def import_teachers(p_teachers: Path) -> list[Teacher]:
     #   'math, programming, data science'
     df_teachers = pd.read_csv(p_teachers)
     teachers = []
-    for i, row in df_teachers.iterrows():
+    for row in df_teachers.itertuples(index=False):
         fullname = row.fullname
         teachable_subjects = []
         for s_subject in row.subjects.split(','):
@@ -1,9 +1,20 @@
-import copy
+import collections
+import concurrent.futures
 import enum
-import random
+import heapq
 from typing import Optional
 
+import numba
+import numpy as np
+
 from modules import entities
+from modules.entities.schedule import GROUP, ROOM, TEACHER, DAY, TIME
+from modules.entities.time_slot import N_DAYS, N_TIMES
+
+
+# Occupancy of an entity is a bitmask with bit (day * N_TIMES + time) set for every busy slot
+assert N_DAYS * N_TIMES <= 32, 'Time slots do not fit in a 32-bit occupancy mask'
+_SLOT_BITS = np.arange(N_DAYS * N_TIMES, dtype=np.uint32)
 
 
 class SelectionStrategy(enum.Enum):
@@ -11,18 +22,153 @@ class SelectionStrategy(enum.Enum):
     RAIN = 1
 
 
+class MutationType(enum.Enum):
+    CHANGE_TIME_SLOT = 0
+    CHANGE_TEACHER = 1
+    CHANGE_ROOM = 3
+    SWAP = 4
+
+
+class _MutationDraws:
+    # Random numbers for a batch of mutations, drawn at once instead of one call per decision
+    def __init__(
+            self,
+            rng: np.random.Generator,
+            size: int,
+            population_size: int,
+            n_sessions: int,
+            n_rooms: int,
+    ) -> None:
+        self.parents = rng.integers(population_size, size=size)
+        self.gates = rng.random(size)
+        self.mutations = rng.choice([m.value for m in MutationType], size=size)
+        self.sessions = rng.integers(n_sessions, size=(size, 2))
+        self.days = rng.integers(N_DAYS, size=size)
+        self.times = rng.integers(N_TIMES, size=size)
+        self.rooms = rng.integers(n_rooms, size=size)
+        self.teacher_picks = rng.random(size)
+
+
+# The kernels below compile N_DAYS, N_TIMES and the GROUP..TIME column indices in as constants.
+# Numba only invalidates its disk cache when this file changes, so delete the cached kernels
+# (modules/__pycache__/scheduler.*.nbi, *.nbc) after editing time_slot.py or schedule.py.
+@numba.njit(cache=True)
+def _check_hard_constraints_numba(
+        sessions_arr: np.ndarray,
+        n_groups: int,
+        n_rooms: int,
+        n_teachers: int,
+) -> bool:
+    busy_groups = np.zeros(n_groups, dtype=np.uint32)
+    busy_rooms = np.zeros(n_rooms, dtype=np.uint32)
+    busy_teachers = np.zeros(n_teachers, dtype=np.uint32)
+    for i in range(sessions_arr.shape[0]):
+        slot_bit = np.uint32(1) << np.uint32(sessions_arr[i, DAY] * N_TIMES + sessions_arr[i, TIME])
+        group = sessions_arr[i, GROUP]
+        room = sessions_arr[i, ROOM]
+        teacher = sessions_arr[i, TEACHER]
+        if (busy_groups[group] | busy_rooms[room] | busy_teachers[teacher]) & slot_bit:
+            return False
+        busy_groups[group] |= slot_bit
+        busy_rooms[room] |= slot_bit
+        busy_teachers[teacher] |= slot_bit
+    return True
+
+
+@numba.njit(cache=True)
+def _calculate_windows_number(
+        entity_ixs: np.ndarray,
+        days: np.ndarray,
+        times: np.ndarray,
+        n_entities: int,
+) -> int:
+    # Bucket the sessions by (entity, day), keeping the first and the last lesson of every bucket
+    first = np.full((n_entities, N_DAYS), N_TIMES, dtype=np.int32)
+    last = np.full((n_entities, N_DAYS), -1, dtype=np.int32)
+    counts = np.zeros((n_entities, N_DAYS), dtype=np.int32)
+    for i in range(entity_ixs.size):
+        entity = entity_ixs[i]
+        day = days[i]
+        time = times[i]
+        counts[entity, day] += 1
+        first[entity, day] = min(first[entity, day], time)
+        last[entity, day] = max(last[entity, day], time)
+
+    res = 0
+    for entity in range(n_entities):
+        for day in range(N_DAYS):
+            if counts[entity, day] > 1:
+                res += last[entity, day] - first[entity, day] - counts[entity, day] + 1
+    return res
+
+
+@numba.njit(cache=True)
+def _get_score_numba(
+        sessions_arr: np.ndarray,
+        n_groups: int,
+        n_teachers: int,
+        group_sizes: np.ndarray,
+        room_capacities: np.ndarray,
+) -> float:
+    days = sessions_arr[:, DAY]
+    times = sessions_arr[:, TIME]
+
+    # Calculate the number of "windows"
+    total_groups_windows = _calculate_windows_number(sessions_arr[:, GROUP], days, times, n_groups)
+    total_teachers_windows = _calculate_windows_number(sessions_arr[:, TEACHER], days, times, n_teachers)
+
+    # Calculate the total number of seats lacking
+    seats_lacking = 0
+    for i in range(sessions_arr.shape[0]):
+        seats_lacking += max(group_sizes[sessions_arr[i, GROUP]] - room_capacities[sessions_arr[i, ROOM]], 0)
+
+    return 1 / (1 + total_groups_windows + total_teachers_windows + seats_lacking)
+
+
+# Arguments of _get_score_numba besides the session array, the same for all schedules of a run.
+# Set once per worker process by _init_score_worker.
+_worker_score_args: tuple = ()
+
+
+def _init_score_worker(
+        n_groups: int,
+        n_teachers: int,
+        group_sizes: np.ndarray,
+        room_capacities: np.ndarray,
+) -> None:
+    global _worker_score_args
+    _worker_score_args = (n_groups, n_teachers, group_sizes, room_capacities)
+
+
+def _get_score_in_worker(sessions_arr: np.ndarray) -> float:
+    return _get_score_numba(sessions_arr, *_worker_score_args)
+
+
 class Scheduler:
     def __init__(
             self,
             population_size: int,
             n_generations: int,
             selection_strategy: SelectionStrategy,
+            n_workers: Optional[int] = None,  # Opt-in: scores schedules in a pool of this many processes
+            seed: Optional[int] = None,
     ) -> None:
         self._population_size = population_size
         self._n_generations = n_generations
         self._selection_strategy = selection_strategy
 
-        self._mutation_probability = 0.3
+        self._mutation_probability = 0.7
+        # All randomness of a run comes from this Generator, so a seed makes runs reproducible
+        self._rng = np.random.default_rng(seed)
+
+        # Fitness evaluation is done in-process unless a number of worker processes is given:
+        # a single evaluation takes microseconds, far less than sending a schedule to a worker
+        self._n_workers = n_workers
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        # Scores of already evaluated schedules, keyed by the content of their session arrays
+        self._score_cache: dict[bytes, float] = {}
+        # Indices of the teachers able to teach the subject of each session row
+        self._session_teachers: list[np.ndarray] = []
 
     def run(
             self,
@@ -30,224 +176,183 @@ class Scheduler:
             rooms: list[entities.room.Room],
             teachers: list[entities.teacher.Teacher],
     ) -> entities.schedule.Schedule:
-        population = self._generate_initial_population(groups=groups, rooms=rooms, teachers=teachers)
+        refs = entities.schedule.ScheduleRefs(groups=groups, rooms=rooms, teachers=teachers)
+        self._score_cache = {}
+        # Indices of the teachers able to teach each subject, keyed by subject name
+        teachers_by_subject: dict[str, list[int]] = collections.defaultdict(list)
+        for ix, teacher in enumerate(teachers):
+            for subject in teacher.teachable_subjects:
+                teachers_by_subject[subject.name].append(ix)
+        # Resolve subject names once, so that the hot paths look teacher candidates up by session row
+        self._session_teachers = [np.array(teachers_by_subject[s.name], dtype=np.intp) for s in refs.session_subjects]
+        if self._n_workers is not None:
+            # The pool lives for one run, its workers receive the lookup tables of the run once
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._n_workers,
+                initializer=_init_score_worker,
+                initargs=(len(groups), len(teachers), refs.group_sizes, refs.room_capacities),
+            )
+        try:
+            return self._run(refs)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _run(
+            self,
+            refs: entities.schedule.ScheduleRefs,
+    ) -> entities.schedule.Schedule:
+        population = self._generate_initial_population(refs)
         assert len(population) > 0, 'Empty initial population'
         best_schedule = population[0]
+        best_score = self._get_scores([best_schedule])[0]
         generations_without_improvement = 0
 
         for generation in range(self._n_generations):
             new_population = []
             while len(new_population) < self._population_size:
-                parent = random.choice(population)
-                child = self._mutate(parent, teachers, rooms)
-                if self._check_hard_constraints(child):
-                    new_population.append(child)
+                draws = _MutationDraws(self._rng, self._population_size, len(population), len(refs.session_subjects), len(refs.rooms))
+                for k, parent_ix in enumerate(draws.parents):
+                    child = self._mutate(population[parent_ix], draws, k)
+                    if self._check_hard_constraints(child):
+                        new_population.append(child)
+                        if len(new_population) == self._population_size:
+                            break
 
+            combined = population + new_population
+            # On equal scores the earlier schedule wins, schedules themselves are never compared
+            scored = [(score, -i, schedule) for i, (score, schedule) in enumerate(zip(self._get_scores(combined), combined))]
             if self._selection_strategy == SelectionStrategy.GREEDY:
-                population = list(sorted(population + new_population, reverse=True, key=lambda x: self._get_score(x)))[:self._population_size]
+                population = [schedule for _, _, schedule in heapq.nlargest(self._population_size, scored)]
             elif self._selection_strategy == SelectionStrategy.RAIN:
-                elite = list(sorted(population + new_population, reverse=True, key=lambda x: self._get_score(x)))[:self._population_size * 0.2]
-                population = elite + random.choices(population + new_population)[:self._population_size - len(elite)]
+                n_elite = int(self._population_size * 0.2)
+                elite = [schedule for _, _, schedule in heapq.nlargest(n_elite, scored)]
+                population = elite + [combined[i] for i in self._rng.integers(len(combined), size=self._population_size - n_elite)]
             else:
                 raise NotImplementedError()
 
-            population.sort(key=lambda x: self._get_score(x), reverse=True)
-            if self._get_score(population[0]) > self._get_score(best_schedule):
-                best_schedule = population[0]
+            generation_best_score, _, generation_best = max(scored)
+            if generation_best_score > best_score:
+                best_score, best_schedule = generation_best_score, generation_best
             else:
                 generations_without_improvement = generations_without_improvement + 1
-            current_score = self._get_score(best_schedule)
+
+            # Forget the scores of the schedules that did not survive
+            survivors = {s.sessions_arr.tobytes() for s in population + [best_schedule]}
+            self._score_cache = {k: v for k, v in self._score_cache.items() if k in survivors}
             print('Best score after {} generations: {}'.format(generations_without_improvement,
-                                                               current_score))
+                                                               best_score))
         return best_schedule
 
     @staticmethod
     def _check_hard_constraints(schedule: entities.schedule.Schedule) -> bool:
-        for s1 in schedule.sessions:
-            for s2 in schedule.sessions:
-                if s1 is s2:
-                    continue
-                if s1.time_slot.time != s2.time_slot.time:
-                    continue
-                if s1.time_slot.day != s2.time_slot.day:
-                    continue
-                if s1.group.name == s2.group.name or s1.room.identifier == s2.room.identifier or s1.teacher.fullname == s2.teacher.fullname:
-                    return False
-        return True
+        refs = schedule.refs
+        return _check_hard_constraints_numba(
+            schedule.sessions_arr,
+            len(refs.groups),
+            len(refs.rooms),
+            len(refs.teachers),
+        )
 
     @staticmethod
     def _get_score(schedule: entities.schedule.Schedule) -> float:
-        # Calculate the number of "windows"
-        groups = set()
-        teachers = set()
-        for s in schedule.sessions:
-            groups.add(s.group.name)
-            teachers.add(s.teacher.fullname)
-        total_groups_windows = 0
-        for group in groups:
-            slots = []
-            for session in schedule.sessions:
-                if session.group.name == group:
-                    slots.append(session.time_slot)
-            total_groups_windows += Scheduler._calculate_windows_number(slots)
-        total_teachers_windows = 0
-        for teacher in teachers:
-            slots = []
-            for session in schedule.sessions:
-                if session.teacher.fullname == teacher:
-                    slots.append(session.time_slot)
-            total_teachers_windows += Scheduler._calculate_windows_number(slots)
-
-        # Calculate the total number of seats lacking
-        seats_lacking = 0
-        for session in schedule.sessions:
-            seats_lacking += max(session.group.size - session.room.capacity, 0)
-
-        return 1 / (1 + total_groups_windows + total_teachers_windows + seats_lacking)
+        refs = schedule.refs
+        return _get_score_numba(
+            schedule.sessions_arr,
+            len(refs.groups),
+            len(refs.teachers),
+            refs.group_sizes,
+            refs.room_capacities,
+        )
 
-    @staticmethod
-    def _calculate_windows_number(time_slots: list[entities.time_slot.TimeSlot]) -> int:
-        res = 0
-        for day in [
-            entities.time_slot.TimeSlotDay.MONDAY,
-            entities.time_slot.TimeSlotDay.TUESDAY,
-            entities.time_slot.TimeSlotDay.WEDNESDAY,
-            entities.time_slot.TimeSlotDay.THURSDAY,
-            entities.time_slot.TimeSlotDay.FRIDAY,
-        ]:
-            slots = [s for s in time_slots if s.day == day]
-            if len(slots) > 1:
-                s0 = min(slots, key=lambda s: s.time.value)
-                s1 = max(slots, key=lambda s: s.time.value)
-                res += (s1.time.value - s0.time.value) - len(slots) + 1
-        return res
+    def _get_scores(self, schedules: list[entities.schedule.Schedule]) -> list[float]:
+        # Identical schedules (e.g. unmutated children) are only evaluated once
+        keys = [schedule.sessions_arr.tobytes() for schedule in schedules]
+        missing = {k: schedule for k, schedule in zip(keys, schedules) if k not in self._score_cache}
+        if self._executor is None:
+            scores = [self._get_score(schedule) for schedule in missing.values()]
+        else:
+            # Only the session arrays are sent, the workers got the lookup tables in their initializer
+            scores = list(self._executor.map(
+                _get_score_in_worker,
+                [schedule.sessions_arr for schedule in missing.values()],
+                chunksize=8,
+            ))
+        self._score_cache.update(zip(missing.keys(), scores))
+        return [self._score_cache[k] for k in keys]
 
     def _generate_initial_population(
             self,
-            groups: list[entities.group.Group],
-            rooms: list[entities.room.Room],
-            teachers: list[entities.teacher.Teacher],
+            refs: entities.schedule.ScheduleRefs,
     ) -> list[entities.schedule.Schedule]:
         population = []
         attempts = 0
         while len(population) < self._population_size and attempts < self._population_size * 100:
             attempts += 1
-            schedule = self._try_generate_valid_schedule(groups=groups, rooms=rooms, teachers=teachers)
+            schedule = self._try_generate_valid_schedule(refs)
             if schedule is not None:
                 population.append(schedule)
         return population
 
     def _try_generate_valid_schedule(
             self,
-            groups: list[entities.group.Group],
-            rooms: list[entities.room.Room],
-            teachers: list[entities.teacher.Teacher],
+            refs: entities.schedule.ScheduleRefs,
     ) -> Optional[entities.schedule.Schedule]:
-        schedule = entities.schedule.Schedule([])
-        for group in groups:
-            for n_sessions, subject in group.required_subjects:
-                for i in range(n_sessions):
-                    # We need to create a session at this group on this subject
-                    teacher_candidates = [t for t in teachers if subject.name in [s.name for s in t.teachable_subjects]]
-                    day_candidates = [
-                        entities.time_slot.TimeSlotDay.MONDAY,
-                        entities.time_slot.TimeSlotDay.TUESDAY,
-                        entities.time_slot.TimeSlotDay.WEDNESDAY,
-                        entities.time_slot.TimeSlotDay.THURSDAY,
-                        entities.time_slot.TimeSlotDay.FRIDAY,
-                    ]
-                    time_candidates = [
-                        entities.time_slot.TimeSlotTime.FIRST,
-                        entities.time_slot.TimeSlotTime.SECOND,
-                        entities.time_slot.TimeSlotTime.THIRD,
-                        entities.time_slot.TimeSlotTime.FOURTH,
-                        entities.time_slot.TimeSlotTime.FIFTH,
-                        entities.time_slot.TimeSlotTime.SIXTH,
-                    ]
-                    room_candidates = rooms.copy()
-                    random.shuffle(teacher_candidates)
-                    random.shuffle(time_candidates)
-                    random.shuffle(day_candidates)
-                    random.shuffle(room_candidates)
-                    session = None
-                    for teacher, room, day, time in self._all_combinations_helper(teacher_candidates, room_candidates, day_candidates, time_candidates):
-                        # Check if interferes with any other session
-                        interferes = False
-                        for session in schedule.sessions:
-                            if not (session.time_slot.day == day and session.time_slot.time == time):
-                                continue
-                            if session.room.identifier != room.identifier and session.teacher.fullname != teacher.fullname and session.group.name != group.name:
-                                continue
-                            interferes = True
-                            break
-                        if interferes:
-                            continue
-                        session = entities.session.Session(room=room, group=group, teacher=teacher, subject=subject, time_slot=entities.time_slot.TimeSlot(day=day, time=time))
-                        break
-                    if session is None:
-                        return None
-                    schedule.sessions.append(session)
+        # Occupancy bitmasks of every group, room and teacher
+        busy_groups = np.zeros(len(refs.groups), dtype=np.uint32)
+        busy_rooms = np.zeros(len(refs.rooms), dtype=np.uint32)
+        busy_teachers = np.zeros(len(refs.teachers), dtype=np.uint32)
+        rows = []
+        for group, teacher_candidates in zip(refs.session_groups, self._session_teachers):
+            # We need to create a session at this group on this subject
+            # busy[teacher, room] has the bits of the slots where the session would interfere with others
+            busy = busy_groups[group] | busy_rooms[np.newaxis] | busy_teachers[teacher_candidates, np.newaxis]
+            free = ((busy[..., np.newaxis] >> _SLOT_BITS) & 1) == 0
+            options = np.flatnonzero(free)
+            if options.size == 0:
+                return None
+            teacher_candidate, room, slot = np.unravel_index(self._rng.choice(options), free.shape)
+            teacher = teacher_candidates[teacher_candidate]
+            day, time = divmod(slot, N_TIMES)
+            slot_bit = np.uint32(1) << np.uint32(slot)
+            busy_groups[group] |= slot_bit
+            busy_rooms[room] |= slot_bit
+            busy_teachers[teacher] |= slot_bit
+            rows.append((group, room, teacher, day, time))
+        schedule = entities.schedule.Schedule(np.array(rows, dtype=np.int32).reshape(-1, 5), refs)
         assert self._check_hard_constraints(schedule)
         return schedule
 
-    @staticmethod
-    def _all_combinations_helper(*iterables):
-        other_iterables = iterables[1:]
-        for v in iterables[0]:
-            if len(other_iterables) == 0:
-                yield (v,)
-            else:
-                for vs in Scheduler._all_combinations_helper(*other_iterables):
-                    yield v, *vs
-
     def _mutate(
             self,
             schedule: entities.schedule.Schedule,
-            teachers: list[entities.teacher.Teacher],
-            rooms: list[entities.room.Room],
+            draws: _MutationDraws,
+            k: int,
     ) -> entities.schedule.Schedule:
-        if random.random() < self._mutation_probability:
+        # Mutate with probability self._mutation_probability, otherwise the child is the parent itself
+        if draws.gates[k] >= self._mutation_probability:
             return schedule
 
-        schedule = copy.deepcopy(schedule)
-
-        class MutationType(enum.Enum):
-            CHANGE_TIME_SLOT = 0
-            CHANGE_TEACHER = 1
-            CHANGE_ROOM = 3
-            SWAP = 4
+        # The lookup tables are immutable and shared, only the session array is copied
+        refs = schedule.refs
+        schedule = entities.schedule.Schedule(schedule.sessions_arr.copy(), refs)
+        arr = schedule.sessions_arr
 
-        mutation = random.choice([MutationType.CHANGE_TIME_SLOT, MutationType.CHANGE_TEACHER, MutationType.CHANGE_ROOM, MutationType.SWAP])
+        mutation = MutationType(draws.mutations[k])
+        i = draws.sessions[k, 0]
         if mutation == MutationType.CHANGE_TIME_SLOT:
-            session = random.choice(schedule.sessions)
-            session.time_slot = entities.time_slot.TimeSlot(
-                time=random.choice([
-                    entities.time_slot.TimeSlotTime.FIRST,
-                    entities.time_slot.TimeSlotTime.SECOND,
-                    entities.time_slot.TimeSlotTime.THIRD,
-                    entities.time_slot.TimeSlotTime.FOURTH,
-                    entities.time_slot.TimeSlotTime.FIFTH,
-                    entities.time_slot.TimeSlotTime.SIXTH,
-                ]),
-                day=random.choice([
-                    entities.time_slot.TimeSlotDay.MONDAY,
-                    entities.time_slot.TimeSlotDay.TUESDAY,
-                    entities.time_slot.TimeSlotDay.WEDNESDAY,
-                    entities.time_slot.TimeSlotDay.THURSDAY,
-                    entities.time_slot.TimeSlotDay.FRIDAY,
-                ])
-            )
+            arr[i, TIME] = draws.times[k]
+            arr[i, DAY] = draws.days[k]
         elif mutation == MutationType.CHANGE_TEACHER:
-            session = random.choice(schedule.sessions)
-            teacher_candidates = [t for t in teachers if session.subject.name in [s.name for s in t.teachable_subjects]]
-            session.teacher = random.choice(teacher_candidates)
+            teacher_candidates = self._session_teachers[i]
+            arr[i, TEACHER] = teacher_candidates[int(draws.teacher_picks[k] * len(teacher_candidates))]
         elif mutation == MutationType.CHANGE_ROOM:
-            session = random.choice(schedule.sessions)
-            session.room = random.choice(rooms)
+            arr[i, ROOM] = draws.rooms[k]
         elif mutation == MutationType.SWAP:
-            i1, i2 = random.choices(list(range(len(schedule.sessions))), k=2)
-            schedule.sessions[i2].time_slot = schedule.sessions[i1].time_slot
-            schedule.sessions[i1].time_slot = schedule.sessions[i2].time_slot
+            i1, i2 = draws.sessions[k]
+            # Fancy indexing on the right-hand side copies, so both time slots are read before writing
+            arr[[i1, i2], DAY:TIME + 1] = arr[[i2, i1], DAY:TIME + 1]
         else:
             raise NotImplementedError()
 